@@ -4,10 +4,26 @@ import requests
 import json
 import os
 import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Configuration
 RUNPOD_API_KEY = os.getenv('RUNPOD_API_KEY')
 GITHUB_REPO_URL = "https://github.com/ShoabSaadat/vibevoice-runpod-serverless"  # Update this!
+RUNPOD_FLASHBOOT = os.getenv('RUNPOD_FLASHBOOT', '1') == '1'
+VV_VOLUME_ID = os.getenv('VV_VOLUME_ID')  # Optional network volume holding model/compile caches
+
+# Shared session so the template and endpoint calls reuse one keep-alive connection
+SESSION = requests.Session()
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {RUNPOD_API_KEY}"
+})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=4,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
 
 def create_serverless_endpoint():
     """Create a serverless endpoint using RunPod API"""
@@ -17,10 +33,6 @@ def create_serverless_endpoint():
         return False
     
     url = "https://api.runpod.ai/graphql"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {RUNPOD_API_KEY}"
-    }
     
     # GraphQL mutation to create endpoint
     mutation = """
@@ -29,10 +41,10 @@ def create_serverless_endpoint():
             containerDiskInGb: 50
             dockerArgs: ""
             env: [
-                {key: "MODEL_PATH", value: "/app/models/VibeVoice-Large"}
+                {key: "RUNPOD_HUGGINGFACE_MODEL", value: "microsoft/VibeVoice-1.5B"}
                 {key: "TRANSFORMERS_CACHE", value: "/app/cache"}
                 {key: "HF_HOME", value: "/app/cache"}
-                {key: "PYTORCH_CUDA_ALLOC_CONF", value: "max_split_size_mb:512"}
+                {key: "PYTORCH_CUDA_ALLOC_CONF", value: "expandable_segments:True"}
             ]
             imageName: "runpod/pytorch:2.2.0-py3.10-cuda12.1.1-devel-ubuntu22.04"
             isPublic: false
@@ -50,7 +62,7 @@ def create_serverless_endpoint():
     """
     
     try:
-        response = requests.post(url, headers=headers, json={"query": mutation})
+        response = SESSION.post(url, json={"query": mutation})
         
         if response.status_code == 200:
             result = response.json()
@@ -62,18 +74,28 @@ def create_serverless_endpoint():
             template_id = result["data"]["saveTemplate"]["id"]
             print(f"✅ Template created with ID: {template_id}")
             
+            # Keeping idle workers for 60s costs some idle billing but avoids a fresh
+            # cold start on every short gap between jobs. RunPod enables FlashBoot
+            # (resuming workers from a cached snapshot) via a "-fb" name suffix
+            endpoint_name = "vibevoice-large-endpoint" + ("-fb" if RUNPOD_FLASHBOOT else "")
+            optional_fields = ""
+            if VV_VOLUME_ID:
+                # json.dumps yields a quoted, escaped GraphQL string literal
+                optional_fields = f"networkVolumeId: {json.dumps(VV_VOLUME_ID)}"
+            
             # Now create the endpoint
             endpoint_mutation = f"""
             mutation {{
                 createEndpoint(input: {{
                     templateId: "{template_id}"
-                    name: "vibevoice-large-endpoint"
+                    name: "{endpoint_name}"
                     workersMax: 1
                     workersMin: 0
-                    idleTimeout: 5
+                    idleTimeout: 60
                     scalerType: "QUEUE_DELAY"
                     scalerValue: 1
                     gpuIds: "NVIDIA GeForce RTX 4090,NVIDIA RTX A6000,NVIDIA A100 80GB PCIe"
+                    {optional_fields}
                 }}) {{
                     id
                     name
@@ -81,7 +103,7 @@ def create_serverless_endpoint():
             }}
             """
             
-            endpoint_response = requests.post(url, headers=headers, json={"query": endpoint_mutation})
+            endpoint_response = SESSION.post(url, json={"query": endpoint_mutation})
             
             if endpoint_response.status_code == 200:
                 endpoint_result = endpoint_response.json()
@@ -99,7 +121,7 @@ def create_serverless_endpoint():
                 return False
         else:
             print(f"❌ Failed to create template: {response.status_code}")
-            print(response.text)
+            print(response.content[:1024].decode("utf-8", errors="replace"))
             return False
             
     except Exception as e:
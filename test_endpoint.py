@@ -1,162 +1,621 @@
 #!/usr/bin/env python3
 
 import requests
+import argparse
+import asyncio
 import json
 import base64
+import binascii
+import contextlib
 import time
+import random
+import hashlib
+import shutil
+import tempfile
+import uuid
+import threading
+import functools
 import os
+import sys
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib json module
+    orjson = None
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:  # status responses are parsed whole instead
+    ijson = None
+
+logger = logging.getLogger("vibevoice.test")
 
 # Configuration - UPDATE THESE!
 ENDPOINT_URL = "https://api.runpod.ai/v2/YOUR_ENDPOINT_ID"  # Replace with your endpoint
 API_KEY = os.getenv("RUNPOD_API_KEY", "YOUR_API_KEY")  # Set via environment or replace
 
+# With --cache, generated audio is cached locally and reruns with unchanged inputs skip
+# the endpoint. Opt-in, since the key can't tell when the worker image was redeployed
+CACHE_DIR = Path(".vibevoice_test_cache")
+CACHE_TTL = 24 * 60 * 60  # seconds
+
+# Test cases served from the cache rather than the endpoint, flagged in the summary
+CACHE_HITS = set()
+
+# End-to-end latency per completed job, for tuning timeouts from real measurements
+TIMINGS = {}
+
+# Successful health checks are reused for a short while instead of re-requested
+HEALTH_TTL = 30  # seconds
+health_cache = {}
+
+def make_retry(**options):
+    """Build a Retry with exponential backoff, adding jitter where urllib3 supports it"""
+    try:
+        return Retry(backoff_factor=0.5, backoff_jitter=0.3, **options)
+    except TypeError:  # urllib3 < 2.0 has no backoff_jitter
+        return Retry(backoff_factor=0.5, **options)
+
+# Reads (status polls, health checks, downloads) are idempotent, so retry transient
+# connection errors and gateway statuses freely
+RETRIES = make_retry(
+    total=4,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset(["GET"])
+)
+
+# A /run submission may already have created a (billed) job by the time a read fails
+# or a 502/504 comes back, so only retry when the request never got through: failed
+# connects, and 429/503 rejections
+SUBMIT_RETRIES = make_retry(
+    total=3,
+    read=0,
+    other=0,
+    status_forcelist=(429, 503),
+    allowed_methods=frozenset(["POST"])
+)
+
+# Upper bound on simultaneous requests: the health check plus the three concurrent tests
+MAX_CONCURRENCY = 4
+
+# Shared session so every test reuses keep-alive connections to the RunPod API. Each
+# pool holds one connection per concurrent test, so polls reuse a warm connection;
+# /run submissions get their own adapter to apply the stricter SUBMIT_RETRIES
+SESSION = requests.Session()
+SESSION.headers.update({"Authorization": f"Bearer {API_KEY}"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONCURRENCY,
+    max_retries=RETRIES
+))
+SESSION.mount(f"{ENDPOINT_URL}/run", HTTPAdapter(
+    pool_maxsize=MAX_CONCURRENCY,
+    max_retries=SUBMIT_RETRIES
+))
+
+def dump_json(payload):
+    """Serialize a request body to bytes, using orjson when it's installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+def load_json(response):
+    """Parse a response body, using orjson when it's installed"""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+def error_body(response, limit=1024):
+    """Decode the start of an error response for printing, skipping charset detection"""
+    return response.content[:limit].decode("utf-8", errors="replace")
+
+def write_base64(audio_base64, f):
+    """Decode base64 audio into a file in chunks; whitespace is skipped and a partial
+    4-character group is carried into the next chunk. Raises ValueError if invalid"""
+    chunk_size = 1 << 16
+    pending = ""
+    for offset in range(0, len(audio_base64), chunk_size):
+        pending += "".join(audio_base64[offset:offset + chunk_size].split())
+        usable = len(pending) - len(pending) % 4
+        f.write(base64.b64decode(pending[:usable], validate=True))
+        pending = pending[usable:]
+    if pending:
+        raise binascii.Error("Incorrect padding")
+
+def spool_base64(audio_base64):
+    """Decode base64 audio into a temporary file; returns its path, or None if invalid"""
+    f = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
+    try:
+        with f:
+            write_base64(audio_base64, f)
+    except ValueError:  # binascii.Error, or non-ASCII characters
+        os.unlink(f.name)
+        return None
+    except BaseException:
+        os.unlink(f.name)
+        raise
+    return f.name
+
+def load_status(response):
+    """Parse a streamed job status response; with ijson, inline audio is spooled
+    to a temporary file during parsing and replaced by an 'audio_file' path.
+    Spooled paths are listed under 'spooled_files' for discard_spooled()"""
+    if ijson is None:
+        return load_json(response)
+    
+    response.raw.decode_content = True
+    builder = ObjectBuilder()
+    spooled = []
+    pending_key = False
+    
+    try:
+        for _, event, value in ijson.parse(response.raw):
+            # Hold back the audio_base64 key until its value shows whether it decodes;
+            # invalid audio is kept as-is so only that item fails, not the whole status
+            if pending_key:
+                pending_key = False
+                path = spool_base64(value) if event == "string" else None
+                if path is not None:
+                    spooled.append(path)
+                    builder.event("map_key", "audio_file")
+                    builder.event(event, path)
+                    continue
+                builder.event("map_key", "audio_base64")
+            
+            if event == "map_key" and value == "audio_base64":
+                pending_key = True
+                continue
+            
+            builder.event(event, value)
+    except Exception:
+        for path in spooled:
+            os.unlink(path)
+        raise
+    
+    result = builder.value
+    if spooled:
+        result["spooled_files"] = spooled
+    return result
+
+def discard_spooled(result):
+    """Remove spooled audio files that save_audio didn't move into place"""
+    for path in (result or {}).get("spooled_files", []):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+class CircuitBreaker:
+    """Fail fast after repeated timeouts instead of waiting on an unresponsive endpoint"""
+    
+    def __init__(self, threshold=3, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+    
+    def check(self):
+        """Raise if the circuit is open; long-running calls check this as they go"""
+        with self.lock:
+            if time.perf_counter() < self.open_until:
+                raise RuntimeError("circuit open: endpoint recently timed out")
+    
+    def call(self, fn, *args, **kwargs):
+        self.check()
+        
+        try:
+            result = fn(*args, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            with self.lock:
+                # Closed -> open at the threshold; after the cooldown a single
+                # failed probe (half-open) reopens the circuit straight away
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.open_until = time.perf_counter() + self.cooldown
+            raise
+        
+        with self.lock:
+            self.failures = 0
+            self.open_until = 0
+        return result
+
+# The tests run concurrently, so one timeout is enough to abort the others mid-poll
+BREAKER = CircuitBreaker(threshold=1)
+
 def test_health_check():
     """Test if the endpoint is healthy"""
-    print("🔍 Testing health check...")
+    logger.info("🔍 Testing health check...")
+    
+    checked_at = health_cache.get(ENDPOINT_URL)
+    if checked_at is not None and time.perf_counter() - checked_at < HEALTH_TTL:
+        logger.info(f"✅ Health check passed {time.perf_counter() - checked_at:.0f}s ago (cached)")
+        return True
     
     try:
-        response = requests.get(f"{ENDPOINT_URL}/health", timeout=30)
+        response = SESSION.get(f"{ENDPOINT_URL}/health", timeout=30)
         if response.status_code == 200:
-            health_data = response.json()
-            print(f"✅ Health check passed: {health_data}")
+            health_data = load_json(response)
+            logger.info(f"✅ Health check passed: {health_data}")
+            health_cache[ENDPOINT_URL] = time.perf_counter()
             return True
         else:
-            print(f"❌ Health check failed: {response.status_code}")
+            logger.error(f"❌ Health check failed: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ Health check error: {e}")
+        logger.error(f"❌ Health check error: {e}")
         return False
 
-def test_audio_generation(test_case="basic"):
-    """Test audio generation with different inputs"""
-    
-    test_cases = {
-        "basic": {
-            "text": "Speaker 1: Hello! Welcome to VibeVoice. Speaker 2: This is incredible quality!",
-            "speaker_names": ["Alice", "Bob"],
-            "description": "Basic 2-speaker conversation"
-        },
-        "podcast": {
-            "text": "Host: Welcome to Tech Talk Today! Our guest is an AI researcher. Guest: Thanks for having me. I'm excited to discuss the future of voice synthesis. Host: Let's start with VibeVoice - what makes it special?",
-            "speaker_names": ["Host", "Expert"],
-            "description": "Podcast-style dialogue"
-        },
-        "multilingual": {
-            "text": "Speaker 1: Hello, how are you today? Speaker 2: 你好！我很好，谢谢。Today is a beautiful day.",
-            "speaker_names": ["Emma", "Li"],
-            "description": "Mixed English-Chinese conversation"
-        }
-    }
-    
-    test_data = test_cases.get(test_case, test_cases["basic"])
+def wait_for_job(job_id, timeout=300):
+    """Poll a submitted job with exponential backoff until it reaches a final status"""
+    deadline = time.perf_counter() + timeout
+    delay = 0.5
     
-    print(f"🎙️ Testing audio generation: {test_data['description']}")
-    print(f"Text: {test_data['text'][:100]}...")
-    
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
+    while True:
+        # Stop waiting as soon as another test's timeout opens the circuit, cancelling
+        # the job so it doesn't keep a worker busy
+        try:
+            BREAKER.check()
+        except RuntimeError:
+            SESSION.post(f"{ENDPOINT_URL}/cancel/{job_id}", timeout=30)
+            raise
+        
+        with SESSION.get(f"{ENDPOINT_URL}/status/{job_id}", timeout=30, stream=True) as response:
+            response.raise_for_status()
+            result = load_status(response)
+        
+        if result.get("status") in ("COMPLETED", "FAILED", "CANCELLED", "TIMED_OUT"):
+            return result
+        
+        if time.perf_counter() + delay > deadline:
+            raise requests.exceptions.Timeout(f"Job {job_id} still {result.get('status')}")
+        
+        # Jitter keeps concurrent tests from polling in lockstep
+        time.sleep(delay * random.uniform(0.8, 1.2))
+        delay = min(delay * 2, 5)
+
+TEST_CASES = {
+    "basic": {
+        "text": "Speaker 1: Hello! Welcome to VibeVoice. Speaker 2: This is incredible quality!",
+        "speaker_names": ["Alice", "Bob"],
+        "description": "Basic 2-speaker conversation"
+    },
+    "podcast": {
+        "text": "Host: Welcome to Tech Talk Today! Our guest is an AI researcher. Guest: Thanks for having me. I'm excited to discuss the future of voice synthesis. Host: Let's start with VibeVoice - what makes it special?",
+        "speaker_names": ["Host", "Expert"],
+        "description": "Podcast-style dialogue"
+    },
+    "multilingual": {
+        "text": "Speaker 1: Hello, how are you today? Speaker 2: 你好！我很好，谢谢。Today is a beautiful day.",
+        "speaker_names": ["Emma", "Li"],
+        "description": "Mixed English-Chinese conversation"
     }
-    
-    payload = {
+}
+
+# Request bodies for the fixed test cases, serialized once and reused by every call
+PRE_ENCODED = {
+    name: dump_json({
         "input": {
             "text": test_data["text"],
             "speaker_names": test_data["speaker_names"],
             "output_format": "wav"
         }
-    }
+    })
+    for name, test_data in TEST_CASES.items()
+}
+
+def run_job(body):
+    """Submit a JSON body to /run and wait for its final status; returns None on HTTP errors"""
+    # Submit asynchronously and poll, so slow cold starts can't hit a gateway timeout
+    response = BREAKER.call(
+        SESSION.post,
+        f"{ENDPOINT_URL}/run",
+        data=body,
+        headers={"Content-Type": "application/json"},
+        timeout=30
+    )
     
+    if response.status_code != 200:
+        logger.error(f"❌ HTTP Error {response.status_code}: {error_body(response)}")
+        return None
+    
+    job_id = load_json(response)["id"]
+    logger.info(f"📨 Job submitted: {job_id}")
+    return BREAKER.call(wait_for_job, job_id)
+
+def cache_key(test_data, voice_urls=None):
+    """Key cached audio by endpoint and generation inputs"""
+    inputs = {"text": test_data["text"], "speaker_names": test_data["speaker_names"]}
+    if voice_urls:
+        inputs["voice_urls"] = voice_urls
+    material = json.dumps(inputs, sort_keys=True) + ENDPOINT_URL
+    return hashlib.blake2b(material.encode("utf-8"), digest_size=16).hexdigest()
+
+def cache_lookup(key):
+    """Return the cached audio path for a key if it exists and hasn't expired"""
+    path = CACHE_DIR / f"{key}.wav"
     try:
-        print("⏳ Sending request...")
-        start_time = time.time()
+        if time.time() - path.stat().st_mtime < CACHE_TTL:
+            return path
+    except FileNotFoundError:
+        pass
+    return None
+
+def cache_store(key, filename):
+    """Copy a saved audio file into the cache"""
+    CACHE_DIR.mkdir(exist_ok=True)
+    shutil.copyfile(filename, CACHE_DIR / f"{key}.wav")
+
+def output_filename(test_case):
+    """Name an output file; the random suffix keeps concurrent tests from colliding"""
+    return f"test_output_{test_case}_{int(time.time())}_{uuid.uuid4().hex[:8]}.wav"
+
+def save_audio(output, test_case):
+    """Save the audio from a successful generation output; returns the filename"""
+    filename = output_filename(test_case)
+    
+    if "audio_url" in output:
+        # Stream the presigned download straight to disk; the URL carries its own
+        # credentials, so the RunPod bearer token must not be sent to storage
+        with SESSION.get(output["audio_url"], stream=True, timeout=300,
+                         headers={"Authorization": None}) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(filename, "wb") as f:
+                shutil.copyfileobj(response.raw, f, length=1 << 20)
+    elif output.get("audio_file"):
+        # Inline audio already decoded to disk while the status response was parsed
+        shutil.move(output["audio_file"], filename)
+    elif "audio_base64" in output:
+        # Decode straight to disk rather than materializing a second full copy in memory
+        try:
+            with open(filename, "wb") as f:
+                write_base64(output["audio_base64"], f)
+        except ValueError as e:
+            os.unlink(filename)
+            logger.error(f"❌ Invalid base64 audio in response: {e}")
+            return None
+    else:
+        logger.error("❌ No audio data in response")
+        return None
+    
+    size_mb = os.path.getsize(filename) / (1 << 20)
+    logger.info(f"💾 Audio saved as: {filename} ({size_mb:.2f} MB)")
+    return filename
+
+def test_audio_generation(test_case="basic", use_cache=False, voice_urls=None):
+    """Test audio generation with different inputs"""
+    test_data = TEST_CASES.get(test_case, TEST_CASES["basic"])
+    
+    logger.info(f"🎙️ Testing audio generation: {test_data['description']}")
+    logger.info(f"Text: {test_data['text'][:100]}...")
+    
+    key = cache_key(test_data, voice_urls)
+    cached = cache_lookup(key) if use_cache else None
+    if cached:
+        filename = output_filename(test_case)
+        shutil.copyfile(cached, filename)
+        logger.info(f"♻️ Using cached audio; the endpoint was not called")
+        logger.info(f"💾 Audio saved as: {filename}")
+        CACHE_HITS.add(test_case)
+        return True
+    
+    result = None
+    try:
+        logger.info("⏳ Sending request...")
+        start_time = time.perf_counter()
         
-        # Use runsync for synchronous execution
-        response = requests.post(f"{ENDPOINT_URL}/runsync", json=payload, headers=headers, timeout=300)
+        if voice_urls:
+            # Reference clips go by URL; the worker downloads them itself, so the
+            # request body stays small instead of carrying base64-encoded WAVs
+            body = dump_json({
+                "input": {
+                    "text": test_data["text"],
+                    "speaker_names": test_data["speaker_names"],
+                    "voice_urls": voice_urls,
+                    "output_format": "wav"
+                }
+            })
+        else:
+            body = PRE_ENCODED.get(test_case, PRE_ENCODED["basic"])
+        
+        result = run_job(body)
+        if result is None:
+            return False
         
-        end_time = time.time()
+        end_time = time.perf_counter()
         duration = end_time - start_time
+        TIMINGS[test_case] = duration
         
-        print(f"⏱️ Request completed in {duration:.1f} seconds")
+        logger.info(f"⏱️ Request completed in {duration:.1f} seconds")
+        logger.info(f"📊 Job status: {result.get('status')}")
+        logger.info(f"Response keys: {list(result.keys())}")
         
-        if response.status_code == 200:
-            result = response.json()
-            print(f"📊 Response status: {response.status_code}")
-            print(f"Response keys: {list(result.keys())}")
+        output = result.get("output") or {}
+        if result.get("status") == "COMPLETED" and output.get("success"):
+            logger.info(f"✅ Audio generation successful!")
+            logger.info(f"   Format: {output.get('format')}")
+            logger.info(f"   Speakers: {output.get('speakers')}")
+            logger.info(f"   Text length: {len(test_data['text'])} characters")
             
-            if "output" in result and result["output"].get("success"):
-                output = result["output"]
-                print(f"✅ Audio generation successful!")
-                print(f"   Size: {output.get('size_mb', 'unknown')} MB")
-                print(f"   Format: {output.get('format', 'unknown')}")
-                print(f"   Speakers: {output.get('speakers', [])}")
-                print(f"   Text length: {output.get('text_length', 0)} characters")
-                
-                # Save the audio file
-                if "audio_base64" in output:
-                    audio_data = base64.b64decode(output["audio_base64"])
-                    filename = f"test_output_{test_case}_{int(time.time())}.wav"
-                    
-                    with open(filename, "wb") as f:
-                        f.write(audio_data)
-                    
-                    print(f"💾 Audio saved as: {filename}")
-                    return True
-                else:
-                    print("❌ No audio data in response")
-                    return False
-            else:
-                error_msg = result.get("output", {}).get("error", "Unknown error")
-                print(f"❌ Generation failed: {error_msg}")
-                return False
+            filename = save_audio(output, test_case)
+            if filename and use_cache:
+                cache_store(key, filename)
+            return filename is not None
         else:
-            print(f"❌ HTTP Error {response.status_code}: {response.text}")
+            error_msg = output.get("error") or result.get("error", "Unknown error")
+            logger.error(f"❌ Generation failed: {error_msg}")
             return False
             
     except requests.exceptions.Timeout:
-        print("❌ Request timed out (>300 seconds)")
+        logger.error("❌ Request timed out (>300 seconds)")
         return False
     except Exception as e:
-        print(f"❌ Request failed: {e}")
+        logger.error(f"❌ Request failed: {e}")
         return False
+    finally:
+        discard_spooled(result)
+
+def test_batch_generation(test_cases, voice_urls=None):
+    """Test generating several cases in one batched job"""
+    logger.info(f"🎙️ Testing batched audio generation: {', '.join(test_cases)}")
+    
+    payload = {
+        "input": {
+            "batch": [
+                {
+                    "text": TEST_CASES[test_case]["text"],
+                    "speaker_names": TEST_CASES[test_case]["speaker_names"]
+                }
+                for test_case in test_cases
+            ],
+            "output_format": "wav"
+        }
+    }
+    if voice_urls:
+        payload["input"]["voice_urls"] = voice_urls
+    
+    result = None
+    try:
+        logger.info("⏳ Sending request...")
+        start_time = time.perf_counter()
+        
+        result = run_job(dump_json(payload))
+        if result is None:
+            return [False] * len(test_cases)
+        
+        duration = time.perf_counter() - start_time
+        TIMINGS["batch"] = duration
+        logger.info(f"⏱️ Request completed in {duration:.1f} seconds")
+        
+        output = result.get("output") or {}
+        if result.get("status") != "COMPLETED" or "items" not in output:
+            error_msg = output.get("error") or result.get("error", "Unknown error")
+            logger.error(f"❌ Batch generation failed: {error_msg}")
+            return [False] * len(test_cases)
+        
+        results = []
+        for test_case, item in zip(test_cases, output["items"]):
+            if item.get("success"):
+                results.append(save_audio(item, test_case) is not None)
+            else:
+                logger.error(f"❌ {test_case} failed: {item.get('error', 'Unknown error')}")
+                results.append(False)
+        return results
+        
+    except requests.exceptions.Timeout:
+        logger.error("❌ Request timed out (>300 seconds)")
+        return [False] * len(test_cases)
+    except Exception as e:
+        logger.error(f"❌ Request failed: {e}")
+        return [False] * len(test_cases)
+    finally:
+        discard_spooled(result)
+
+async def run_audio_tests(executor, test_cases, use_cache=False, voice_urls=None):
+    """Run independent audio generation tests concurrently, each in its own thread"""
+    # Each test does its HTTP calls and audio file writes inside its worker thread,
+    # so slow disk I/O never blocks the event loop or the other tests
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                executor,
+                functools.partial(test_audio_generation, test_case, use_cache, voice_urls)
+            )
+            for test_case in test_cases
+        )
+    )
 
 def main():
     """Run all tests"""
-    print("🚀 VibeVoice-Large Serverless Endpoint Tester")
-    print("=" * 50)
+    # Concurrent tests hand log records to a queue; one listener thread writes them
+    # out, so tests never contend for the stdout lock
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    listener.start()
+    try:
+        run_tests()
+    finally:
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        logger.propagate = True
+
+def run_tests():
+    """Run the health check and audio generation tests"""
+    parser = argparse.ArgumentParser(description="Test a VibeVoice RunPod endpoint")
+    parser.add_argument("--batch", action="store_true",
+                        help="send all generation cases as one batched job")
+    parser.add_argument("--cache", action="store_true",
+                        help="cache generated audio locally and reuse it instead of calling the endpoint")
+    parser.add_argument("--voice", action="append", default=[], metavar="NAME=URL",
+                        help="reference clip URL for a speaker name; may be repeated")
+    args = parser.parse_args()
+    
+    voice_urls = {}
+    for voice in args.voice:
+        name, sep, url = voice.partition("=")
+        if not sep:
+            parser.error(f"--voice expects NAME=URL, got {voice!r}")
+        voice_urls[name] = url
+    
+    logger.info("🚀 VibeVoice-Large Serverless Endpoint Tester")
+    logger.info("=" * 50)
     
     if not API_KEY or API_KEY == "YOUR_API_KEY":
-        print("❌ Please set your RunPod API key!")
-        print("   export RUNPOD_API_KEY='your-key-here'")
+        logger.error("❌ Please set your RunPod API key!")
+        logger.info("   export RUNPOD_API_KEY='your-key-here'")
         return
     
     if "YOUR_ENDPOINT_ID" in ENDPOINT_URL:
-        print("❌ Please update ENDPOINT_URL with your actual endpoint!")
+        logger.error("❌ Please update ENDPOINT_URL with your actual endpoint!")
         return
     
-    # Test 1: Health Check
-    print("\n1️⃣ Health Check Test")
-    health_ok = test_health_check()
-    
-    if not health_ok:
-        print("❌ Skipping audio tests due to health check failure")
-        return
+    # One pool, sized like the session's connection pool, serves every test
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        # Test 1: Health Check
+        logger.info("\n1️⃣ Health Check Test")
+        health_ok = executor.submit(test_health_check).result()
+        
+        if not health_ok:
+            logger.error("❌ Skipping audio tests due to health check failure")
+            return
+        
+        # Test 2: Audio generation cases, either as one batched job (one round trip, one
+        # model pass) or concurrently as separate jobs spread across workers
+        logger.info("\n2️⃣ Audio Generation Tests (basic, podcast, multilingual)")
+        test_cases = ["basic", "podcast", "multilingual"]
+        if args.batch:
+            results = test_batch_generation(test_cases, voice_urls)
+        else:
+            results = asyncio.run(run_audio_tests(
+                executor, test_cases, use_cache=args.cache, voice_urls=voice_urls
+            ))
     
-    # Test 2: Basic Audio Generation
-    print("\n2️⃣ Basic Audio Generation Test")
-    basic_ok = test_audio_generation("basic")
+    for test_case, ok in zip(test_cases, results):
+        note = " (cached, endpoint not called)" if test_case in CACHE_HITS else ""
+        logger.log(logging.INFO if ok else logging.ERROR, f"   {'✅' if ok else '❌'} {test_case}{note}")
     
-    # Test 3: Podcast Style (if basic worked)
-    if basic_ok:
-        print("\n3️⃣ Podcast Style Test")
-        test_audio_generation("podcast")
-        
-        print("\n4️⃣ Multilingual Test")
-        test_audio_generation("multilingual")
+    if TIMINGS:
+        logger.info("\n⏱️ Job latency:")
+        for name, duration in sorted(TIMINGS.items(), key=lambda item: item[1]):
+            logger.info(f"   {name}: {duration:.1f}s")
+        logger.info(f"   slowest: {max(TIMINGS.values()):.1f}s (poll timeout: 300s)")
     
-    print("\n🎉 Testing complete!")
-    print("\nTo use your endpoint:")
-    print(f"   Endpoint URL: {ENDPOINT_URL}/runsync")
-    print(f"   API Key: {API_KEY[:8]}...")
+    logger.info("\n🎉 Testing complete!")
+    logger.info("\nTo use your endpoint:")
+    logger.info(f"   Endpoint URL: {ENDPOINT_URL}/runsync")
+    logger.info(f"   API Key: {API_KEY[:8]}...")
 
 if __name__ == "__main__":
     main()